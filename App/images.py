@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from pathlib import Path
+from urllib.parse import urlparse
+
+from django.conf import settings
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+MAX_DOWNLOAD_BYTES = 10 * 1024 * 1024
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+
+class AllowlistRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follow redirects only when the target is allowlisted too, so an allowed
+    CDN can't bounce the server onto internal hosts."""
+
+    def __init__(self, is_allowed):
+        super().__init__()
+        self.is_allowed = is_allowed
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not self.is_allowed(newurl):
+            raise urllib.error.HTTPError(newurl, code, f"redirect to non-allowlisted URL {newurl}", headers, fp)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+class ThumbnailCache:
+    """On-disk, size-bounded LRU cache of product thumbnails.
+
+    Each remote image is downloaded once, shrunk to card size and stored as
+    WebP under a hash of its URL. File mtimes double as the LRU clock: hits
+    touch the file and eviction removes the oldest ones first. URLs that
+    fail to download are remembered for `failure_ttl` seconds so dead links
+    don't cost a full timeout on every page view.
+
+    Downloads never run on the event loop's default executor (shared with the
+    scrapers): proxy requests use their own `workers` threads and prefetches
+    a bounded queue drained by `workers` daemon threads.
+    """
+
+    def __init__(self, directory, max_bytes: int, size=(400, 400), quality: int = 80,
+                 allowed_hosts=(), timeout: float = 5.0, workers: int = 8,
+                 failure_ttl: float = 300.0, max_pending: int = 256):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.size = tuple(size)
+        self.quality = quality
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.timeout = timeout
+        self.workers = workers
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        self._total_bytes = None  # Computed lazily from disk
+        self._in_flight = {}  # url -> Future of the download in progress
+        self._failures = {}  # url -> time.monotonic() until which it is skipped
+        self._opener = urllib.request.build_opener(AllowlistRedirectHandler(self.is_allowed))
+        self._request_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail-request')
+        self._prefetch_queue = queue.Queue(maxsize=max_pending)
+        self._prefetch_threads = []
+
+    # --- Public API ---
+
+    def is_allowed(self, url: str) -> bool:
+        """Only proxy http(s) images from the marketplace CDNs (no open proxy)."""
+        if not url:
+            return False
+        parsed = urlparse(url)
+        host = (parsed.hostname or '').lower()
+        if parsed.scheme not in ('http', 'https') or not host:
+            return False
+        return any(host == h or host.endswith('.' + h) for h in self.allowed_hosts)
+
+    def path_for(self, url: str) -> Path:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return self.directory / key[:2] / f"{key}.webp"
+
+    def get(self, url: str):
+        """Return the cached thumbnail path, or None on a miss."""
+        path = self.path_for(url)
+        try:
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_or_fetch(self, url: str):
+        """Return the thumbnail path, downloading it on a miss. None if it can't be fetched.
+        If the same URL is already being downloaded (e.g. by a prefetch), waits for that instead."""
+        if not self.is_allowed(url):
+            return None
+        path = self.get(url)
+        if path:
+            return path
+        with self._lock:
+            if self._recently_failed(url):
+                return None
+            future = self._in_flight.get(url)
+            if future is None:
+                future = self._in_flight[url] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            try:
+                return future.result(timeout=self.timeout * 2)
+            except TimeoutError:
+                return None
+        return self._fetch_once(url, future)
+
+    def load(self, url: str):
+        """Thumbnail bytes for `url`, or None if it can't be fetched."""
+        path = self.get_or_fetch(url)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None  # Evicted between lookup and read
+
+    async def aload(self, url: str):
+        """Async `load` on the proxy's own thread pool. None on failure or timeout."""
+        loop = asyncio.get_running_loop()
+        try:
+            # Cancelling a job that hasn't started drops it from the pool's queue
+            return await asyncio.wait_for(loop.run_in_executor(self._request_pool, self.load, url),
+                                          timeout=self.timeout * 2)
+        except asyncio.TimeoutError:
+            return None
+
+    def prefetch(self, urls):
+        """Download thumbnails for `urls` in the background. Never blocks the caller;
+        URLs that don't fit in the queue are skipped and fetched on demand instead."""
+        queued = 0
+        with self._lock:
+            for url in dict.fromkeys(urls):
+                if url in self._in_flight or not self.is_allowed(url) or self._recently_failed(url):
+                    continue
+                if self.path_for(url).exists():
+                    continue
+                future = Future()
+                try:
+                    self._prefetch_queue.put_nowait((url, future))
+                except queue.Full:
+                    break
+                self._in_flight[url] = future
+                queued += 1
+            if queued and not self._prefetch_threads:
+                # Daemon threads: pending prefetches must never hold up shutdown
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._prefetch_worker, name=f'thumbnail-prefetch-{i}', daemon=True)
+                    thread.start()
+                    self._prefetch_threads.append(thread)
+        return queued
+
+    # --- Internals ---
+
+    def _prefetch_worker(self):
+        while True:
+            url, future = self._prefetch_queue.get()
+            try:
+                self._fetch_once(url, future)
+            except Exception:
+                logger.exception("Thumbnail prefetch failed for %s", url)
+
+    def _recently_failed(self, url) -> bool:
+        """Caller must hold self._lock."""
+        until = self._failures.get(url)
+        if until is None:
+            return False
+        if time.monotonic() < until:
+            return True
+        del self._failures[url]
+        return False
+
+    def _fetch_once(self, url, future):
+        """Download `url` and hand the result to everyone waiting on `future`."""
+        path = None
+        try:
+            path = self._fetch(url)
+        finally:
+            with self._lock:
+                self._in_flight.pop(url, None)
+            future.set_result(path)
+        return path
+
+    def _fetch(self, url):
+        try:
+            req = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+            with self._opener.open(req, timeout=self.timeout) as resp:
+                raw = resp.read(MAX_DOWNLOAD_BYTES + 1)
+            if len(raw) > MAX_DOWNLOAD_BYTES:
+                raise ValueError("image too large")
+            data = self._resize(raw)
+        except Exception as exc:
+            logger.warning("Thumbnail fetch failed for %s: %s", url, exc)
+            with self._lock:
+                self._failures[url] = time.monotonic() + self.failure_ttl
+            return None
+        return self._store(url, data)
+
+    def _resize(self, raw: bytes) -> bytes:
+        with Image.open(io.BytesIO(raw)) as img:
+            img.draft('RGB', self.size)  # Cheap JPEG downscale before decoding
+            img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            img.thumbnail(self.size)
+            out = io.BytesIO()
+            img.save(out, 'WEBP', quality=self.quality, method=4)
+        return out.getvalue()
+
+    def _store(self, url, data: bytes) -> Path:
+        path = self.path_for(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so readers never see a partial file
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        existed = path.exists()
+        os.replace(tmp, path)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._disk_usage()
+            elif not existed:
+                self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def _disk_usage(self) -> int:
+        return sum(p.stat().st_size for p in self.directory.glob('*/*.webp'))
+
+    def _evict(self):
+        """Drop least recently used files until usage is back under 90% of the cap."""
+        entries = []
+        for p in self.directory.glob('*/*.webp'):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total_bytes = total
+
+
+thumbnails = ThumbnailCache(
+    directory=getattr(settings, 'THUMBNAIL_CACHE_DIR', settings.BASE_DIR / 'thumb_cache'),
+    max_bytes=getattr(settings, 'THUMBNAIL_CACHE_MAX_BYTES', 200 * 1024 * 1024),
+    size=getattr(settings, 'THUMBNAIL_SIZE', (400, 400)),
+    quality=getattr(settings, 'THUMBNAIL_QUALITY', 80),
+    allowed_hosts=getattr(settings, 'THUMBNAIL_ALLOWED_HOSTS', ()),
+    timeout=getattr(settings, 'THUMBNAIL_FETCH_TIMEOUT', 5.0),
+    workers=getattr(settings, 'THUMBNAIL_WORKERS', 8),
+    failure_ttl=getattr(settings, 'THUMBNAIL_FAILURE_TTL', 300.0),
+    max_pending=getattr(settings, 'THUMBNAIL_PREFETCH_QUEUE_SIZE', 256),
+)
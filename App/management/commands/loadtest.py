@@ -0,0 +1,368 @@
+import argparse
+import asyncio
+import json
+import math
+import platform
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import django
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import override_settings
+
+from App.models import SearchHistory
+from App.persistence import history_writer
+from App.utils import FakeScraper
+
+ENDPOINTS = ('search_hit', 'search_miss', 'history', 'snapshot')
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def non_negative_float(value):
+    number = float(value)
+    if not number >= 0:  # Also rejects nan
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {value}")
+    return number
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class QueryCounter:
+    """Counts SQL queries on every connection, whichever thread opened it.
+    Views run their ORM calls in sync_to_async worker threads and the history
+    writer has its own thread, so per-thread helpers like
+    CaptureQueriesContext would miss most of them."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def install(self):
+        connection_created.connect(self._on_connection, weak=False)
+
+    def uninstall(self):
+        connection_created.disconnect(self._on_connection)
+
+    def _on_connection(self, sender, connection, **kwargs):
+        # Fires on every reconnect of the same per-thread wrapper
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class SimulatedClient:
+    """One simulated browser: a logged-in user talking to the ASGI app."""
+
+    def __init__(self, app, cookie, snapshot_pks, hit_query):
+        self.app = app
+        self.cookie = cookie
+        self.snapshot_pks = snapshot_pks
+        self.hit_query = hit_query
+
+    async def get(self, path, query_string=''):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query_string.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', self.cookie.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        request_sent = False
+        status = None
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Never disconnect; Django cancels this once the response is sent
+            await asyncio.Future()
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await self.app(scope, receive, send)
+        return status
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test search, history and snapshot views through the ASGI app, "
+        "using the fake scraper backend and a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=positive_int, default=10, help="Simultaneous clients (default: 10)")
+        parser.add_argument('--requests', type=positive_int, default=200, help="Requests per endpoint (default: 200)")
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+        parser.add_argument('--latency', type=non_negative_float, default=0.05, help="Fake scraper latency per site, seconds (default: 0.05)")
+        parser.add_argument('--results', type=positive_int, default=20, help="Fake products per site (default: 20)")
+        parser.add_argument('--users', type=positive_int, default=None, help="Seeded users (default: one per client)")
+        parser.add_argument('--history', type=positive_int, default=50, help="Seeded history entries per user (default: 50)")
+        parser.add_argument('--memory-requests', type=positive_int, default=50,
+                            help="Requests in the separate, untimed tracemalloc pass per endpoint (default: 50)")
+        parser.add_argument('--no-memory', action='store_true', help="Skip the memory pass")
+        parser.add_argument('--save-baseline', metavar='PATH', help="Write the report as a JSON baseline")
+        parser.add_argument('--baseline', metavar='PATH', help="Compare against a saved JSON baseline")
+        parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed regression ratio (default: 0.10)")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.loads(Path(options['baseline']).read_text())
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {exc}")
+
+        fake_settings = dict(
+            DEBUG=False,  # DEBUG keeps every SQL query in memory
+            ALLOWED_HOSTS=['localhost'],
+            SCRAPER_BACKEND='fake',
+            FAKE_SCRAPER_LATENCY=options['latency'],
+            FAKE_SCRAPER_RESULTS=options['results'],
+        )
+        counter = QueryCounter()
+        counter.install()
+        with tempfile.TemporaryDirectory() as tmp, override_settings(**fake_settings):
+            # File-backed test database so the real one is untouched and the
+            # SQLite profile (WAL etc.) behaves as it would in production
+            test_settings = connection.settings_dict.setdefault('TEST', {})
+            old_test_name = test_settings.get('NAME')
+            test_settings['NAME'] = str(Path(tmp) / 'loadtest.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                report = self.run_load(options, counter)
+            finally:
+                history_writer.stop()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                test_settings['NAME'] = old_test_name
+                counter.uninstall()
+
+        self.print_report(report)
+        if options['save_baseline']:
+            Path(options['save_baseline']).write_text(json.dumps(report, indent=2) + '\n')
+            self.stdout.write(f"Baseline saved to {options['save_baseline']}")
+        if baseline:
+            regressions = self.compare(report, baseline, options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{regressions} endpoint metric(s) regressed beyond tolerance")
+
+    # --- Setup ---
+
+    def seed(self, options):
+        """Create users with history and log each one in. Returns (cookie, snapshot pks) per user."""
+        num_users = options['users'] or options['concurrency']
+        history_per_user = options['history']
+        sessions = []
+        for i in range(num_users):
+            user = User.objects.create_user(username=f"loadtest{i}", password='loadtest-password')
+            entries = [
+                SearchHistory(
+                    user=user,
+                    query=f"seed {n}",
+                    results_data=[
+                        item
+                        for source in ('Amazon', 'eBay', 'Cdiscount')
+                        for item in FakeScraper(f"seed {n}", source, num_results=options['results']).products()
+                    ]
+                )
+                for n in range(history_per_user)
+            ]
+            SearchHistory.objects.bulk_create(entries)
+            client = Client()
+            client.force_login(user)
+            cookie = f"sessionid={client.cookies['sessionid'].value}"
+            pks = list(SearchHistory.objects.filter(user=user).values_list('pk', flat=True))
+            sessions.append((cookie, pks))
+        return sessions
+
+    # --- Load generation ---
+
+    def run_load(self, options, counter):
+        self.stdout.write("Seeding users and history...")
+        sessions = self.seed(options)
+        app = get_asgi_application()
+        # Clients sharing a session must share its cached query, or they would
+        # keep evicting each other's cache and search_hit would measure misses
+        clients = [
+            SimulatedClient(app, *sessions[i % len(sessions)], hit_query=f"cached query {i % len(sessions)}")
+            for i in range(options['concurrency'])
+        ]
+        measure_memory = not options['no_memory']
+        endpoints = {}
+        for name in options['endpoints']:
+            self.stdout.write(f"Running {name}...")
+            endpoints[name] = asyncio.run(self.run_endpoint(name, clients, options, counter, measure_memory))
+
+        return {
+            'meta': {
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'fake_latency': options['latency'],
+                'fake_results_per_site': options['results'],
+                'history_per_user': options['history'],
+                'memory_traced': measure_memory,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            },
+            'endpoints': endpoints,
+        }
+
+    async def run_endpoint(self, name, clients, options, counter, measure_memory):
+        if name == 'search_hit':
+            # Each client's first search fills its session cache (untimed)
+            await asyncio.gather(*(c.get('/search/', f"q={c.hit_query.replace(' ', '+')}") for c in clients))
+            await asyncio.to_thread(history_writer.flush)
+
+        total = options['requests']
+        queries_before = counter.count
+        latencies, errors, elapsed = await self.drive(name, clients, total)
+        # Writes deferred by the write-behind queue still belong to this endpoint
+        await asyncio.to_thread(history_writer.flush)
+        queries = counter.count - queries_before
+
+        latencies.sort()
+        result = {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'queries_per_request': round(queries / len(latencies), 2) if latencies else 0.0,
+        }
+        if measure_memory:
+            # Separate pass: tracing makes every request several times slower,
+            # so it must not overlap with the timed one
+            tracemalloc.start()
+            try:
+                mem_before = tracemalloc.get_traced_memory()[0]
+                await self.drive(name, clients, options['memory_requests'], first=total)
+                await asyncio.to_thread(history_writer.flush)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            result['peak_memory_kb'] = round((peak - mem_before) / 1024, 1)
+        return result
+
+    async def drive(self, name, clients, total, first=0):
+        """Send `total` requests to one endpoint from all clients at once.
+        Returns (latencies, error count, wall time)."""
+        next_index = 0
+        latencies = []
+        errors = 0
+
+        def build_request(client, n):
+            if name == 'search_hit':
+                return '/search/', f"q={client.hit_query.replace(' ', '+')}"
+            if name == 'search_miss':
+                return '/search/', f"q=loadtest+miss+{n}"
+            if name == 'history':
+                return '/history/', ''
+            pk = client.snapshot_pks[n % len(client.snapshot_pks)]
+            return f"/history/snapshot/{pk}/", ''
+
+        async def worker(client):
+            nonlocal next_index, errors
+            while next_index < total:
+                n = first + next_index
+                next_index += 1
+                path, qs = build_request(client, n)
+                start = time.perf_counter()
+                status = await client.get(path, qs)
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(c) for c in clients))
+        return latencies, errors, time.perf_counter() - started
+
+    # --- Reporting ---
+
+    def print_report(self, report):
+        columns = ('endpoint', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'peak_memory_kb', 'errors')
+        rows = [
+            [name] + [str(stats.get(c, '-')) for c in columns[1:]]
+            for name, stats in report['endpoints'].items()
+        ]
+        widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)]
+
+        def line(cells):
+            # Endpoint names left-aligned, numbers right-aligned
+            return '  '.join(cell.ljust(w) if i == 0 else cell.rjust(w)
+                             for i, (cell, w) in enumerate(zip(cells, widths)))
+
+        header = line(columns)
+        self.stdout.write('')
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in rows:
+            self.stdout.write(line(row))
+        self.stdout.write('')
+
+    def compare(self, report, baseline, tolerance):
+        """Print deltas against the baseline and return the number of regressions."""
+        memory_comparable = report['meta'].get('memory_traced') and baseline.get('meta', {}).get('memory_traced')
+        if report['meta'].get('memory_traced') != baseline.get('meta', {}).get('memory_traced'):
+            self.stdout.write(self.style.WARNING(
+                "Baseline was recorded with a different --no-memory setting; memory not compared"))
+        # Higher is better for rps, lower is better for the rest
+        checks = [('rps', -1), ('p50_ms', 1), ('p95_ms', 1), ('p99_ms', 1), ('queries_per_request', 1)]
+        if memory_comparable:
+            checks.append(('peak_memory_kb', 1))
+
+        regressions = 0
+        self.stdout.write(f"Compared to baseline from {baseline.get('meta', {}).get('timestamp', '?')}:")
+        for name, stats in report['endpoints'].items():
+            old = baseline.get('endpoints', {}).get(name)
+            if not old:
+                continue
+            parts = []
+            for metric, direction in checks:
+                if not old.get(metric) or metric not in stats:
+                    continue
+                change = (stats[metric] - old[metric]) / old[metric]
+                text = f"{metric} {change:+.1%}"
+                if change * direction > tolerance:
+                    regressions += 1
+                    text = self.style.ERROR(text)
+                parts.append(text)
+            self.stdout.write(f"  {name:<12} " + ', '.join(parts))
+        return regressions
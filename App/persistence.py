@@ -0,0 +1,141 @@
+import atexit
+import logging
+import queue
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .models import SearchHistory
+
+logger = logging.getLogger(__name__)
+
+
+class SearchHistoryWriter:
+    """Write-behind queue for SearchHistory rows.
+
+    Views enqueue unsaved instances and return immediately; a single
+    background thread drains the queue and inserts them in batches,
+    one transaction per batch.
+    """
+
+    def __init__(self, max_size: int = 1000, batch_size: int = 50, flush_interval: float = 0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='search-history-writer', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, entry: SearchHistory) -> bool:
+        """Queue an unsaved entry without touching the database.
+        Returns False when the queue is full so the caller can save it inline."""
+        self.start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            return False
+        return True
+
+    def flush(self):
+        """Block until every queued entry has been written."""
+        if self._thread is None or not self._thread.is_alive():
+            # No writer running: drain on this thread instead
+            self._write_remaining()
+            return
+        self._queue.join()
+
+    def stop(self, timeout: float = 5.0):
+        """Flush pending entries and stop the writer thread."""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                # Never write from two threads at once; the writer keeps going
+                logger.warning("History writer still busy after %ss, %d entries left unsaved",
+                               timeout, self._queue.qsize())
+                return
+            self._thread = None
+        # Anything enqueued after the thread exited still gets saved
+        self._write_remaining()
+
+    # --- Internals ---
+
+    def _drain(self, block: bool):
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._drain(block=True)
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        connection.close()
+
+    def _write_remaining(self):
+        while batch := self._drain(block=False):
+            self._write(batch)
+
+    def _write(self, batch):
+        if not batch:
+            return
+        # Honour CONN_MAX_AGE on this long-lived thread the same way a request would
+        close_old_connections()
+        try:
+            with transaction.atomic():
+                SearchHistory.objects.bulk_create(batch)
+            return
+        except Exception:
+            if len(batch) == 1:
+                logger.exception("Failed to save search history entry (user_id=%s, query=%r)",
+                                 batch[0].user_id, batch[0].query)
+                return
+            logger.warning("Batch of %d search history entries failed, retrying one by one", len(batch))
+        # One bad row (e.g. its user was deleted meanwhile) must not take the others down
+        for entry in batch:
+            # The rolled-back insert may already have assigned a pk
+            entry.pk = None
+            entry._state.adding = True
+            self._write([entry])
+
+
+history_writer = SearchHistoryWriter(
+    max_size=getattr(settings, 'HISTORY_QUEUE_SIZE', 1000),
+    batch_size=getattr(settings, 'HISTORY_BATCH_SIZE', 50),
+    flush_interval=getattr(settings, 'HISTORY_FLUSH_INTERVAL', 0.5),
+)
+
+# Flush whatever is still queued when the server process exits
+atexit.register(history_writer.stop)
+
+
+async def save_search(user, query, results):
+    """Persist a search through the write-behind queue, or inline when it is
+    disabled or full (backpressure instead of dropping history)."""
+    # Copy the list: the view sorts it in place before the writer serialises it
+    entry = SearchHistory(user=user, query=query, results_data=list(results))
+    if getattr(settings, 'HISTORY_WRITE_BEHIND', True) and history_writer.enqueue(entry):
+        return
+    await sync_to_async(entry.save)()
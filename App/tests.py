@@ -1,3 +1,355 @@
-from django.test import TestCase
+import http.server
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .images import ThumbnailCache
+from .management.commands.loadtest import Command as LoadTestCommand, percentile
+from .models import SearchHistory
+from .persistence import SearchHistoryWriter, save_search
+from .utils import get_results_safe
+
+
+class SearchHistoryWriterTests(TransactionTestCase):
+    # The writer saves from its own thread, so rows must really be committed
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.writer = SearchHistoryWriter(max_size=10, batch_size=5, flush_interval=0.05)
+        self.addCleanup(self.writer.stop)
+
+    def test_enqueued_entries_are_saved_on_flush(self):
+        for i in range(7):
+            self.assertTrue(self.writer.enqueue(SearchHistory(user=self.user, query=f"q{i}", results_data=[])))
+        self.writer.flush()
+        self.assertEqual(SearchHistory.objects.filter(user=self.user).count(), 7)
+
+    def test_full_queue_falls_back_to_inline_save(self):
+        writer = SearchHistoryWriter(max_size=1)
+        with mock.patch.object(writer, 'start'):  # No thread, so the queue never drains
+            self.assertTrue(writer.enqueue(SearchHistory(user=self.user, query='queued', results_data=[])))
+            with mock.patch('App.persistence.history_writer', writer):
+                async_to_sync(save_search)(self.user, 'inline', [{'price': 1}])
+        self.assertTrue(SearchHistory.objects.filter(query='inline').exists())
+        self.assertFalse(SearchHistory.objects.filter(query='queued').exists())
+        writer.flush()
+        self.assertTrue(SearchHistory.objects.filter(query='queued').exists())
+
+    def test_bad_row_does_not_drop_the_rest_of_its_batch(self):
+        self.writer.enqueue(SearchHistory(user=self.user, query='ok', results_data=[]))
+        self.writer.enqueue(SearchHistory(user_id=999999, query='orphan', results_data=[]))
+        self.writer.enqueue(SearchHistory(user=self.user, query='ok too', results_data=[]))
+        with self.assertLogs('App.persistence', level='ERROR') as logs:
+            self.writer.flush()
+        self.assertEqual(SearchHistory.objects.filter(query__in=['ok', 'ok too']).count(), 2)
+        self.assertFalse(SearchHistory.objects.filter(query='orphan').exists())
+        self.assertIn("'orphan'", logs.output[0])
+
+    def test_stop_does_not_write_while_writer_is_still_running(self):
+        self.writer.enqueue(SearchHistory(user=self.user, query='pending', results_data=[]))
+        self.writer.flush()
+        busy = mock.Mock(is_alive=mock.Mock(return_value=True))
+        self.writer._thread, real_thread = busy, self.writer._thread
+        self.writer._queue.put_nowait(SearchHistory(user=self.user, query='left', results_data=[]))
+        with mock.patch.object(self.writer, '_write') as write, self.assertLogs('App.persistence', level='WARNING'):
+            self.writer.stop(timeout=0)
+        write.assert_not_called()
+        self.writer._thread = real_thread
+
+
+
+@override_settings(SCRAPER_BACKEND='fake', FAKE_SCRAPER_LATENCY=0, FAKE_SCRAPER_RESULTS=2)
+class SearchViewPersistenceTests(TransactionTestCase):
+
+    def test_new_search_is_queued_and_page_still_renders(self):
+        user = User.objects.create_user(username='carol', password='pw')
+        self.client.force_login(user)
+        writer = SearchHistoryWriter()
+        with mock.patch.object(writer, 'start'), mock.patch('App.persistence.history_writer', writer):
+            response = self.client.get(reverse('search'), {'q': 'rtx 4060'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['results']), 6)
+            # Rendered before anything was written
+            self.assertEqual(writer._queue.qsize(), 1)
+            self.assertFalse(SearchHistory.objects.exists())
+            writer.flush()
+        entry = SearchHistory.objects.get()
+        self.assertEqual((entry.user, entry.query, len(entry.results_data)), (user, 'rtx 4060', 6))
+
+def make_cache(directory, **kwargs):
+    kwargs.setdefault('max_bytes', 10 * 1024 * 1024)
+    kwargs.setdefault('allowed_hosts', ['example.com', 'media-amazon.com'])
+    return ThumbnailCache(directory, **kwargs)
+
+
+def jpeg_bytes(size=(800, 600)):
+    out = io.BytesIO()
+    Image.new('RGB', size, 'red').save(out, 'JPEG')
+    return out.getvalue()
+
+
+class ThumbnailCacheTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = Path(tmp.name)
+
+    def test_is_allowed_only_matches_allowlisted_hosts(self):
+        cache = make_cache(self.directory)
+        self.assertTrue(cache.is_allowed('https://example.com/a.jpg'))
+        self.assertTrue(cache.is_allowed('https://m.media-amazon.com/images/a.jpg'))
+        for url in [
+            'https://example.com.evil.com/a.jpg',
+            'https://example.com@evil.com/a.jpg',
+            'https://user@evil.com/example.com/a.jpg',
+            'https://notexample.com/a.jpg',
+            'https://evil.com/?u=https://example.com/a.jpg',
+            'ftp://example.com/a.jpg',
+            'javascript:alert(1)//example.com',
+            '//example.com/a.jpg',
+            'N/A',
+            '',
+            None,
+        ]:
+            with self.subTest(url=url):
+                self.assertFalse(cache.is_allowed(url))
+
+    def test_eviction_drops_least_recently_used_down_to_90_percent(self):
+        cache = make_cache(self.directory, max_bytes=1000)
+        for i in range(10):
+            cache._store(f"https://example.com/{i}.jpg", b'x' * 100)
+            # Distinct mtimes so the LRU order is well defined
+            os.utime(cache.path_for(f"https://example.com/{i}.jpg"), (i, i))
+        cache.get('https://example.com/0.jpg')  # Touch the oldest one
+
+        cache._store('https://example.com/new.jpg', b'x' * 100)
+
+        self.assertLessEqual(cache._disk_usage(), 900)
+        self.assertEqual(cache._total_bytes, cache._disk_usage())
+        self.assertIsNotNone(cache.get('https://example.com/0.jpg'))
+        self.assertIsNotNone(cache.get('https://example.com/new.jpg'))
+        self.assertIsNone(cache.get('https://example.com/1.jpg'))
+        self.assertIsNone(cache.get('https://example.com/2.jpg'))
+
+    def test_request_waits_for_prefetch_of_the_same_url(self):
+        cache = make_cache(self.directory)
+        url = 'https://example.com/a.jpg'
+        release = threading.Event()
+        calls = []
+
+        def slow_fetch(u):
+            calls.append(u)
+            release.wait(5)
+            return cache._store(u, b'thumb')
+
+        with mock.patch.object(cache, '_fetch', side_effect=slow_fetch):
+            self.assertEqual(cache.prefetch([url, url]), 1)
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                waiting = pool.submit(cache.get_or_fetch, url)
+                release.set()
+                path = waiting.result(5)
+        self.assertEqual(calls, [url])
+        self.assertEqual(path.read_bytes(), b'thumb')
+        self.assertEqual(cache._in_flight, {})
+
+    def test_fetch_resizes_to_webp(self):
+        cache = make_cache(self.directory, size=(400, 400))
+        response = mock.MagicMock()
+        response.__enter__.return_value.read.return_value = jpeg_bytes((1600, 1200))
+        with mock.patch.object(cache._opener, 'open', return_value=response):
+            data = cache.load('https://example.com/a.jpg')
+        with Image.open(io.BytesIO(data)) as img:
+            self.assertEqual((img.format, img.size), ('WEBP', (400, 300)))
+
+    def test_redirect_to_non_allowlisted_host_is_refused(self):
+        hits = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                hits.append(self.path)
+                if self.path == '/a.jpg':
+                    # Same server, but reached through a host that isn't allowlisted
+                    self.send_response(302)
+                    self.send_header('Location', f"http://localhost:{self.server.server_port}/internal-secret")
+                    self.end_headers()
+                else:
+                    body = jpeg_bytes()
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        cache = make_cache(self.directory, allowed_hosts=['127.0.0.1'])
+        url = f"http://127.0.0.1:{server.server_port}/a.jpg"
+        with self.assertLogs('App.images', level='WARNING'):
+            self.assertIsNone(cache.get_or_fetch(url))
+        self.assertEqual(hits, ['/a.jpg'])
+        self.assertEqual(list(self.directory.glob('*/*.webp')), [])
+
+    def test_failed_urls_are_not_retried_until_ttl_expires(self):
+        cache = make_cache(self.directory, failure_ttl=60)
+        url = 'https://example.com/dead.jpg'
+        with mock.patch.object(cache._opener, 'open', side_effect=OSError('timed out')) as opener, \
+                self.assertLogs('App.images', level='WARNING'):
+            self.assertIsNone(cache.get_or_fetch(url))
+            self.assertIsNone(cache.get_or_fetch(url))
+            self.assertEqual(cache.prefetch([url]), 0)
+            self.assertEqual(opener.call_count, 1)
+            with mock.patch('App.images.time.monotonic', return_value=time.monotonic() + 61):
+                cache.get_or_fetch(url)
+            self.assertEqual(opener.call_count, 2)
+
+    def test_prefetch_queue_is_bounded(self):
+        cache = make_cache(self.directory, max_pending=3, workers=1)
+        release = threading.Event()
+        patcher = mock.patch.object(cache, '_fetch', side_effect=lambda u: release.wait(5))
+        patcher.start()
+        # Cleanups run in reverse: drop the backlog, unblock the worker, unpatch
+        self.addCleanup(patcher.stop)
+        self.addCleanup(release.set)
+        self.addCleanup(lambda: [cache._prefetch_queue.get_nowait() for _ in range(cache._prefetch_queue.qsize())])
+
+        # The single worker may pick one job up, freeing one slot
+        queued = cache.prefetch(f"https://example.com/{i}.jpg" for i in range(20))
+        self.assertLessEqual(queued, 4)
+        self.assertTrue(all(t.daemon for t in cache._prefetch_threads))
+
+
+class ImageProxyViewTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch('App.views.thumbnails', make_cache(tmp.name))
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='bob', password='pw')
+        self.client.force_login(self.user)
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('image_proxy'), {'u': 'https://example.com/a.jpg'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(settings.LOGIN_URL))
+
+    def test_disallowed_url_is_404(self):
+        for url in ['https://evil.com/a.jpg', 'https://example.com.evil.com/a.jpg', 'N/A', '']:
+            with self.subTest(url=url):
+                response = self.client.get(reverse('image_proxy'), {'u': url})
+                self.assertEqual(response.status_code, 404)
+
+    def test_failed_fetch_redirects_to_source(self):
+        url = 'https://example.com/gone.jpg'
+        with mock.patch.object(self.cache._opener, 'open', side_effect=OSError('timed out')), \
+                self.assertLogs('App.images', level='WARNING'):
+            response = self.client.get(reverse('image_proxy'), {'u': url})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+
+    def test_cached_thumbnail_is_served_with_long_cache_headers(self):
+        url = 'https://example.com/a.jpg'
+        self.cache._store(url, b'webp-bytes')
+        response = self.client.get(reverse('image_proxy'), {'u': url})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'webp-bytes')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+
+
+class FakeScraperBackendTests(SimpleTestCase):
+
+    @override_settings(SCRAPER_BACKEND='fake', FAKE_SCRAPER_LATENCY=0, FAKE_SCRAPER_RESULTS=3)
+    def test_fake_backend_returns_deterministic_products(self):
+        first = async_to_sync(get_results_safe)('rtx 4060')
+        self.assertEqual(first, async_to_sync(get_results_safe)('rtx 4060'))
+        self.assertNotEqual(first, async_to_sync(get_results_safe)('rx 7600'))
+        self.assertEqual(len(first), 9)
+        self.assertEqual({item['source'] for item in first}, {'Amazon', 'eBay', 'Cdiscount'})
+        self.assertTrue(all(isinstance(item['price'], float) for item in first))
+
+
+class LoadTestReportTests(SimpleTestCase):
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def report(self, memory=True, **stats):
+        endpoint = {'rps': 100.0, 'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 30.0,
+                    'queries_per_request': 2.0, 'peak_memory_kb': 1000.0}
+        endpoint.update(stats)
+        return {'meta': {'memory_traced': memory}, 'endpoints': {'history': endpoint}}
+
+    def compare(self, report, baseline):
+        return LoadTestCommand(stdout=io.StringIO()).compare(report, baseline, tolerance=0.10)
+
+    def test_compare_counts_regressions_in_the_right_direction(self):
+        baseline = self.report()
+        self.assertEqual(self.compare(self.report(), baseline), 0)
+        # Better on every metric: faster, fewer queries, less memory
+        self.assertEqual(self.compare(self.report(rps=200.0, p50_ms=5.0, p95_ms=10.0, p99_ms=15.0,
+                                                  queries_per_request=1.0, peak_memory_kb=500.0), baseline), 0)
+        self.assertEqual(self.compare(self.report(rps=80.0), baseline), 1)
+        self.assertEqual(self.compare(self.report(p50_ms=12.0, p99_ms=40.0), baseline), 2)
+        self.assertEqual(self.compare(self.report(peak_memory_kb=1200.0), baseline), 1)
+        # Within tolerance
+        self.assertEqual(self.compare(self.report(rps=95.0, p95_ms=21.0), baseline), 0)
+
+    def test_compare_skips_memory_when_either_run_did_not_trace_it(self):
+        worse_memory = self.report(peak_memory_kb=5000.0)
+        self.assertEqual(self.compare(worse_memory, self.report(memory=False)), 0)
+        no_memory = self.report(memory=False)
+        del no_memory['endpoints']['history']['peak_memory_kb']
+        self.assertEqual(self.compare(no_memory, self.report()), 0)
+
+
+class LoadTestCommandTests(TransactionTestCase):
+
+    def test_smoke_run_reports_every_endpoint(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        baseline = Path(tmp.name) / 'baseline.json'
+        out = io.StringIO()
+        # Run against the test database instead of creating another one
+        with mock.patch.object(connection.creation, 'create_test_db', return_value=connection.settings_dict['NAME']), \
+                mock.patch.object(connection.creation, 'destroy_test_db'):
+            call_command('loadtest', concurrency=2, requests=4, history=2, results=2, latency=0,
+                         memory_requests=2, save_baseline=str(baseline), stdout=out)
+
+        report = json.loads(baseline.read_text())
+        self.assertEqual(set(report['endpoints']), {'search_hit', 'search_miss', 'history', 'snapshot'})
+        for name, stats in report['endpoints'].items():
+            with self.subTest(endpoint=name):
+                self.assertEqual((stats['requests'], stats['errors']), (4, 0))
+                self.assertGreater(stats['rps'], 0)
+                self.assertIn('peak_memory_kb', stats)
+        # Cache hits only read the session and the user
+        self.assertEqual(report['endpoints']['search_hit']['queries_per_request'], 2.0)
+        self.assertIn('search_hit', out.getvalue())
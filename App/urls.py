@@ -8,4 +8,5 @@ urlpatterns = [
     path('register/', views.register_view, name='register'),
     path('history/', views.history_view, name='history'),
     path('history/snapshot/<int:pk>/', views.snapshot_view, name='snapshot_view'),
+    path('img/', views.image_proxy_view, name='image_proxy'),
 ]
\ No newline at end of file
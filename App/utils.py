@@ -1,10 +1,12 @@
 import asyncio
 import csv
 import json
+import random
 import re
 import sys
 from playwright.async_api import async_playwright
 from asgiref.sync import sync_to_async
+from django.conf import settings
 
 class Webscraper:
     def __init__(self, query: str, headless: bool = True, output_format: str = 'csv', max_pages: int = 1):
@@ -239,6 +241,32 @@ class CdiscountScraper(Webscraper):
         return results
 
 
+class FakeScraper(Webscraper):
+    """Offline stand-in for the real scrapers, used by the load-test harness.
+    Same query -> same products, after a fixed simulated page-load latency."""
+    def __init__(self, query: str, source: str, latency: float = 1.0, num_results: int = 20):
+        super().__init__(query)
+        self.source = source
+        self.latency = latency
+        self.num_results = num_results
+
+    async def scrape(self):
+        await asyncio.sleep(self.latency)
+        return self.products()
+
+    def products(self):
+        rng = random.Random(f"{self.source}:{self.query}")
+        slug = self.query.replace(' ', '-')
+        return [{
+            'title': f"{self.query.title()} {self.source} Item #{i}",
+            'price': round(rng.uniform(5, 1500), 2),
+            'currency': '€',
+            'source': self.source,
+            'url': f"https://example.com/{self.source.lower()}/{slug}/{i}",
+            'img': f"https://example.com/{self.source.lower()}/{slug}/{i}.jpg"
+        } for i in range(self.num_results)]
+
+
 if __name__ == "__main__":
     # Run all scrapers simultaneously for testing
     query = 'rtx 4060'
@@ -264,11 +292,18 @@ if __name__ == "__main__":
 
 async def run_parallel_scrapers(query):
     """Triggers all scrapers at once."""
-    amazon = AmazonScraper(query, headless=True)
-    ebay = EbayScraper(query, headless=True)
-    cdiscount = CdiscountScraper(query, headless=True)
+    if getattr(settings, 'SCRAPER_BACKEND', 'playwright') == 'fake':
+        latency = getattr(settings, 'FAKE_SCRAPER_LATENCY', 1.0)
+        num_results = getattr(settings, 'FAKE_SCRAPER_RESULTS', 20)
+        scrapers = [FakeScraper(query, source, latency, num_results) for source in ('Amazon', 'eBay', 'Cdiscount')]
+    else:
+        scrapers = [
+            AmazonScraper(query, headless=True),
+            EbayScraper(query, headless=True),
+            CdiscountScraper(query, headless=True)
+        ]
 
-    tasks = [amazon.scrape(), ebay.scrape(), cdiscount.scrape()]
+    tasks = [scraper.scrape() for scraper in scrapers]
     raw_results = await asyncio.gather(*tasks)
     
     # Flatten list of lists into one list
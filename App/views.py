@@ -1,9 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.views.decorators.http import require_GET
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.decorators import login_required
 from .models import SearchHistory
 from .forms import UserRegisterForm
 from .utils import get_results_safe
+from .persistence import save_search
+from .images import thumbnails
 from asgiref.sync import sync_to_async
 from django.contrib.auth import login, get_user
 # --- Session Helpers (Same as before) ---
@@ -49,12 +53,10 @@ async def search_view(request):
             await set_cached_data(request, query, results)
         
         # 2. SAVE TO DATABASE
-            # We use sync_to_async because saving to DB is a synchronous action
-            await sync_to_async(SearchHistory.objects.create)(
-                user=user,
-                query=query,
-                results_data=results
-            )
+            # Handed to the write-behind queue so the insert stays off the response path
+            await save_search(user, query, results)
+            # Warm the thumbnail cache so the grid and later snapshots load locally
+            thumbnails.prefetch(item.get('img') for item in results)
 
         # 3. FILTER by Site
         # If the user selected specific sites, filter the list
@@ -145,4 +147,24 @@ def snapshot_view(request, pk):
         'original_sites': original_sites,
         'selected_sites': selected_sites,
         'sort_order': sort_order
-    })
\ No newline at end of file
+    })
+
+# Image Proxy View (async; downloads run on the cache's own threads, not the
+# shared sync thread or the pool get_results_safe uses)
+@require_GET
+@login_required
+async def image_proxy_view(request):
+    url = request.GET.get('u', '')
+    if not thumbnails.is_allowed(url):
+        raise Http404("Image not available")
+
+    data = await thumbnails.aload(url)
+    if data is None:
+        # Upstream unreachable or not an image: let the browser try the original
+        return HttpResponseRedirect(url)
+
+    response = HttpResponse(data, content_type='image/webp')
+    # Thumbnails are keyed by source URL, so they never change. Private: the
+    # view requires login, so shared caches must not serve it to anyone else
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,6 +81,43 @@ DATABASES = {
     }
 }
 
+# Opt-in SQLite tuning for concurrent searches: PRICETRACK_DB_PROFILE=production
+# WAL lets readers run alongside the writer, synchronous=NORMAL drops the fsync
+# per commit (still durable across app crashes) and busy timeout waits on locks
+# instead of raising "database is locked".
+# CONN_MAX_AGE only keeps connections open on long-lived threads: WSGI workers
+# and the history writer. Under ASGI every request runs its ORM calls on a
+# fresh thread, so it still opens (and closes) one connection per request;
+# WAL is stored in the database file, so that reconnect stays cheap.
+if os.environ.get('PRICETRACK_DB_PROFILE') == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.environ.get('PRICETRACK_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-20000;'
+            ),
+            # Take the write lock up front so concurrent writers queue on the timeout
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': int(os.environ.get('PRICETRACK_DB_TIMEOUT', 20)),
+        },
+    })
+
+# Scraper backend: 'playwright' (live sites) or 'fake' (offline, deterministic;
+# used by `manage.py loadtest`)
+SCRAPER_BACKEND = os.environ.get('PRICETRACK_SCRAPER_BACKEND', 'playwright')
+FAKE_SCRAPER_LATENCY = 1.0  # Seconds per simulated site
+FAKE_SCRAPER_RESULTS = 20   # Products per simulated site
+
+# Search history write-behind (see App/persistence.py)
+HISTORY_WRITE_BEHIND = True
+HISTORY_QUEUE_SIZE = 1000   # Beyond this, searches are saved inline
+HISTORY_BATCH_SIZE = 50     # Max rows per insert transaction
+HISTORY_FLUSH_INTERVAL = 0.5  # Seconds the writer waits for new rows
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -117,6 +155,24 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Product image proxy (see App/images.py)
+THUMBNAIL_CACHE_DIR = BASE_DIR / 'thumb_cache'
+THUMBNAIL_CACHE_MAX_BYTES = 200 * 1024 * 1024  # LRU eviction above this
+THUMBNAIL_SIZE = (400, 400)  # Cards are ~200px tall, x2 for high-DPI screens
+THUMBNAIL_QUALITY = 80       # WebP quality
+THUMBNAIL_FETCH_TIMEOUT = 5.0
+THUMBNAIL_WORKERS = 8                # Download threads, for proxy requests and prefetch each
+THUMBNAIL_PREFETCH_QUEUE_SIZE = 256  # Beyond this, images are fetched on demand
+THUMBNAIL_FAILURE_TTL = 300.0        # Seconds a failed URL is not retried
+# Only images from these CDNs (and their subdomains) are proxied; redirects
+# are followed only when they stay on these hosts
+THUMBNAIL_ALLOWED_HOSTS = [
+    'media-amazon.com',
+    'ssl-images-amazon.com',
+    'ebayimg.com',
+    'cdscdn.com',
+]
+
 # Redirect URLs after login/logout
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'